@@ -46,33 +46,88 @@ import argparse
 
 import csv
 
+import functools
+
+import hashlib
+
+import logging
+
 import os
 
 import shutil
 
 import subprocess
 
-import tempfile
+import threading
 
-from datetime import datetime
+import traceback
 
-from string import Template
+from concurrent.futures import ThreadPoolExecutor
+
+from datetime import datetime, timezone
 
 import re
 
 import sys
 
-import json
+ 
+
+ 
+
+logger = logging.getLogger('agent-apply')
+
+# Resolve the git executable once instead of a $PATH walk on every exec.
+GIT = shutil.which('git') or 'git'
 
-import urllib.request
+# Rows are processed concurrently (see main()); stdout is shared between workers.
+_print_lock = threading.Lock()
+_row_output = threading.local()
 
-import urllib.error
+
+def log(*args):
+    """print() that is safe to call from row workers.
+
+    Inside process_row() lines are buffered and emitted as one block when the row
+    finishes; elsewhere they are printed immediately under the stdout lock.
+    """
+    lines = getattr(_row_output, 'lines', None)
+    if lines is None:
+        with _print_lock:
+            print(*args, flush=True)
+    else:
+        lines.append(' '.join(str(a) for a in args))
 
  
 
  
 
-def _yaml_syntax_check(path):
+# Digests of YAML files that already passed _yaml_syntax_check(), mapped to the
+# check message. Shared by the row workers.
+_yaml_passed = {}
+_yaml_passed_lock = threading.Lock()
+
+
+def _yaml_syntax_check(text):
+    """Best-effort YAML syntax check of rendered text, skipped if it already passed.
+
+    Rows that differ only in tokens a file doesn't use render it byte-identical,
+    so passes are remembered by content digest and repeats skip the parse.
+    """
+    digest = hashlib.blake2b(text.encode('utf-8')).digest()
+    with _yaml_passed_lock:
+        if digest in _yaml_passed:
+            return True, _yaml_passed[digest]
+    ok, msg = _parse_yaml_text(text)
+    if ok:
+        with _yaml_passed_lock:
+            _yaml_passed[digest] = msg
+    return ok, msg
+
+ 
+
+ 
+
+def _parse_yaml_text(text):
 
     """Best-effort YAML syntax check.
 
@@ -90,21 +145,15 @@ def _yaml_syntax_check(path):
 
  
 
-        with open(path, 'r', encoding='utf-8') as fh:
-
-            yaml.safe_load(fh)
+        yaml.safe_load(text)
 
         return True, 'ok'
 
     except ModuleNotFoundError:
 
-        # Heuristic: ensure file is readable and no unresolved placeholders.
-
-        with open(path, 'r', encoding='utf-8') as fh:
+        # Heuristic: no unresolved placeholders.
 
-            data = fh.read()
-
-        if '@@' in data:
+        if '@@' in text:
 
             return False, 'unresolved template placeholders (@@...@@)'
 
@@ -118,115 +167,287 @@ def _yaml_syntax_check(path):
 
  
 
-def _text_guardrails(path, *, forbidden_substrings=None):
+def _text_guardrails(text, *, forbidden_substrings=None):
 
-    forbidden_substrings = forbidden_substrings or []
+    for s in forbidden_substrings or ():
 
-    with open(path, 'r', encoding='utf-8') as fh:
+        if s in text:
 
-        data = fh.read()
+            return False, f'found forbidden substring: {s}'
 
-    for s in forbidden_substrings:
+    return True, 'ok'
 
-        if s in data:
+ 
 
-            return False, f'found forbidden substring: {s}'
+ 
 
-    return True, 'ok'
+# Placeholder grammar once @@NAME@@ has been normalized to @NAME. '@' avoids
+# collisions with Helm's {{ }}; '@@' escapes a literal '@', @NAME and @{NAME}
+# are tokens and any other '@' (e.g. in an email address) is left alone. This is
+# string.Template's pattern for delimiter '@', including its IGNORECASE flag.
+_PLACEHOLDER_RE = re.compile(r'''
+    @(?:
+      (?P<escaped>@)                |
+      (?P<named>[A-Z][_A-Z0-9]*)    |
+      {(?P<braced>[A-Z][_A-Z0-9]*)} |
+      (?P<invalid>)
+    )
+    ''', re.IGNORECASE | re.VERBOSE)
 
  
 
  
 
-class ATTemplate(Template):
+def run(cmd, cwd=None):
+
+    logger.debug('RUN: %s (cwd=%s)', cmd, cwd)
 
-    """Template using @@VARNAME@@ placeholders.
+    if getattr(_row_output, 'lines', None) is not None:
+        # Keep the command's stdout inside this row's output block.
+        result = subprocess.run(cmd, cwd=cwd, check=False, stdout=subprocess.PIPE, universal_newlines=True)
+        if result.stdout:
+            log(result.stdout.rstrip('\n'))
+        return result
+
+    return subprocess.run(cmd, cwd=cwd, check=False)
 
  
 
-    We pick a delimiter that avoids collisions with Helm's {{ }} and also avoids
+ 
 
-    accidental replacement of email addresses or common YAML content.
+def start(cmd, cwd=None):
+    """Start cmd in the background with its stdout piped and return the Popen.
 
+    Use for commands that are independent of the step running next; collect the
+    output with communicate() at the point it is needed.
     """
+    logger.debug('RUN (background): %s (cwd=%s)', cmd, cwd)
+    return subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, universal_newlines=True)
+
+ 
 
  
 
-    # Using delimiter '@@' would not work with string.Template (single char).
+def _open_pygit2(workdir):
+    """Open workdir with pygit2 when doing so is equivalent to using the git CLI.
+
+    pygit2 is optional. Returns None (callers fall back to the git CLI) when it is
+    not installed, when the commit identity comes from GIT_AUTHOR_*/GIT_COMMITTER_*
+    (libgit2 only reads config), or when commits need hooks or signing, which
+    libgit2 does not run. Hooks count whether they come from core.hooksPath or
+    were copied into .git/hooks (e.g. by init.templateDir).
+    """
+    try:
+        # Optional dependency; we don't require it.
+        import pygit2  # type: ignore
+    except ModuleNotFoundError:
+        return None
+    if any(k.startswith(('GIT_AUTHOR_', 'GIT_COMMITTER_')) for k in os.environ):
+        return None
+    try:
+        repo = pygit2.Repository(workdir)
+        repo.default_signature
+    except (pygit2.GitError, KeyError):
+        return None
+    config = repo.config
+    if 'core.hooksPath' in config or ('commit.gpgsign' in config and config.get_bool('commit.gpgsign')):
+        return None
+    try:
+        hooks = os.listdir(os.path.join(repo.path, 'hooks'))
+    except OSError:
+        hooks = []
+    if any(not name.endswith('.sample') for name in hooks):
+        return None
+    return repo
 
-    # So we keep delimiter '@' but require the pattern @@NAME@@ via the regex.
+ 
 
-    delimiter = '@'
+ 
 
-    idpattern = r'[A-Z][_A-Z0-9]*'
+def checkout_new_branch(workdir, branch):
+    """Create branch at HEAD and switch to it (git checkout -b)."""
+    repo = _open_pygit2(workdir)
+    if repo is None:
+        run([GIT, 'checkout', '-b', branch], cwd=workdir)
+        return
+    ref = repo.branches.local.create(branch, repo.head.peel())
+    repo.set_head(ref.name)
+    logger.debug('pygit2: checked out new branch %s (cwd=%s)', branch, workdir)
 
  
 
  
 
-def _normalize_tokens(tokens):
+def commit_paths(workdir, paths, message):
+    """Stage exactly paths and commit them on the current branch.
+
+    In-process via pygit2 when available, saving the git add/commit process
+    start-ups and repository discovery for every repo.
+    """
+    repo = _open_pygit2(workdir)
+    if repo is None:
+        run([GIT, 'add', *paths], cwd=workdir)
+        # Only the paths staged above are committed; don't walk the tree for untracked files.
+        run([GIT, 'commit', '--untracked-files=no', '-m', message], cwd=workdir)
+        return
+    index = repo.index
+    for path in paths:
+        index.add(path.replace(os.sep, '/'))
+    index.write()
+    tree = index.write_tree()
+    head = repo.head.peel()
+    if tree == head.tree_id:
+        # Same as the CLI: don't create an empty commit.
+        log('nothing to commit, working tree clean')
+        return
+    changed = len(head.tree.diff_to_tree(repo[tree]))
+    signature = repo.default_signature
+    commit = repo.create_commit('HEAD', signature, signature, message, tree, [head.id])
+    log(f"Committed {changed} changed files as {commit}: {message}")
 
-    """Expand token map so @@NAME@@ patterns can be matched reliably."""
+ 
 
-    expanded = {}
+ 
 
-    for k, v in tokens.items():
+# Legacy @@NAME@@ placeholders, rewritten to @NAME before splitting.
+_AT_NORMALIZE_RE = re.compile(r'@@([A-Z][_A-Z0-9]*)@@')
 
-        expanded[k] = v
 
-        expanded[f"@{k}"] = v
 
-        expanded[f"{k}@"] = v
+@functools.lru_cache(maxsize=None)
+def split_template(path):
+    """Read a template once and pre-split it into literal segments and token keys.
 
-        expanded[f"@{k}@"] = v
+    Returns (literals, keys) with len(literals) == len(keys) + 1. Each key is a
+    (name, placeholder) pair; the original placeholder text is kept so unknown
+    tokens are left as-is, exactly like string.Template.safe_substitute().
+    """
+    with open(path, 'r', encoding='utf-8') as fh:
+        content = fh.read()
+    # Normalize any legacy @@NAME@@ placeholders to @NAME
+    content = _AT_NORMALIZE_RE.sub(r'@\1', content)
 
-    return expanded
+    literals, keys, segment = [], [], []
+    pos = 0
+    for mo in _PLACEHOLDER_RE.finditer(content):
+        segment.append(content[pos:mo.start()])
+        pos = mo.end()
+        name = mo.group('named') or mo.group('braced')
+        if name is not None:
+            literals.append(''.join(segment))
+            segment = []
+            keys.append((name, mo.group()))
+        elif mo.group('escaped') is not None:
+            segment.append('@')
+        else:
+            segment.append(mo.group())
+    segment.append(content[pos:])
+    literals.append(''.join(segment))
+    return tuple(literals), tuple(keys)
 
  
 
  
 
-def run(cmd, cwd=None, capture=False):
+@functools.lru_cache(maxsize=None)
+def compile_template(path):
+    """Compile a template into a Python function render(tokens) -> str.
+
+    The function body is generated from split_template() as a single join over
+    the literal segments and token lookups, so rendering a row runs no regex and
+    no per-placeholder loop. Literals and names are embedded with repr().
+    """
+    literals, keys = split_template(path)
+    parts = [repr(literals[0])] if literals[0] else []
+    for (name, placeholder), literal in zip(keys, literals[1:]):
+        parts.append(f"str(t.get({name!r}, {placeholder!r}))")
+        if literal:
+            parts.append(repr(literal))
+    body = f"''.join(({', '.join(parts)},))" if parts else "''"
+    namespace = {}
+    exec(compile(f"def render(t):\n    return {body}\n", f'<template {path}>', 'exec'), namespace)
+    return namespace['render']
 
-    print(f"RUN: {' '.join(cmd)} (cwd={cwd})")
+ 
 
-    if capture:
+ 
 
-        return subprocess.run(cmd, cwd=cwd, check=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+# Tokens that differ on every row (appName is unique within a run, and the image
+# name and repo follow it). Outputs of templates that use them are never reused.
+_PER_ROW_TOKENS = frozenset({'APP_NAME', 'APPLICATION_IMAGE_NAME', 'IMAGE_REPO'})
 
-    return subprocess.run(cmd, cwd=cwd, check=False)
 
- 
 
- 
+@functools.lru_cache(maxsize=None)
+def template_token_names(path):
+    """Distinct token names referenced by a template, in order of appearance."""
+    return tuple(dict.fromkeys(name for name, _ in split_template(path)[1]))
 
-def render_template(template_dir, template_name, tokens):
 
-    path = os.path.join(template_dir, template_name)
 
-    with open(path, 'r', encoding='utf-8') as fh:
+def _render(template_path, tokens):
+    rendered = compile_template(template_path)(tokens)
+    return rendered, '@@' in rendered
 
-        content = fh.read()
 
-    # Normalize any legacy @@NAME@@ placeholders to @NAME
 
-    content = re.sub(r'@@([A-Z][_A-Z0-9]*)@@', r'@\1', content)
+@functools.lru_cache(maxsize=256)
+def _render_shared(template_path, items):
+    return _render(template_path, dict(items))
 
-    tmpl = ATTemplate(content)
 
-    rendered = tmpl.safe_substitute(tokens)
+
+def render_cached(template_path, tokens):
+    """Render a template, memoized when its output can repeat across rows.
+
+    Templates that only use shared values (ports, base image, config names) are
+    cached on the values of the tokens they reference, in a bounded LRU; those
+    that use a per-row token are rendered directly. Returns (text, unresolved).
+    """
+    names = template_token_names(template_path)
+    if _PER_ROW_TOKENS.intersection(names):
+        return _render(template_path, tokens)
+    return _render_shared(template_path, tuple((name, tokens[name]) for name in names if name in tokens))
 
  
 
-    # Basic guardrail: if a template still contains @@SOMETHING@@, that means a
+ 
 
-    # token is missing (or typo). Keep it non-fatal, but make it visible.
+def _write_if_changed(path, text, newline=None):
+    """Write a rendered file as UTF-8, leaving it untouched if it already matches.
 
-    if '@@' in rendered:
+    When an existing branch already has the same output, the file keeps its
+    mtime, so git still sees it as clean without re-hashing it. newline has the
+    same meaning as for open().
+    """
+    if newline is None:
+        newline = os.linesep
+    data = (text if newline in ('', '\n') else text.replace('\n', newline)).encode('utf-8')
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as fh:
+                if fh.read() == data:
+                    return
+    except OSError:
+        pass
+    # Complete bytes in a single write() call.
+    with open(path, 'wb') as fh:
+        fh.write(data)
 
-        # Don't spam the whole file; just warn.
+ 
 
-        print(f"WARN: Unresolved placeholders remain in template {template_name}")
+ 
+
+def render_to(path_out, template_path, tokens, newline=None):
+    """Render a template (see render_cached()) into path_out and return the text."""
+    rendered, unresolved = render_cached(template_path, tokens)
+
+    _write_if_changed(path_out, rendered, newline=newline)
+
+    # Basic guardrail: if a template still contains @@SOMETHING@@, that means a
+    # token is missing (or typo). Keep it non-fatal, but make it visible.
+    if unresolved:
+        log(f"WARN: Unresolved placeholders remain in template {os.path.basename(template_path)}")
 
     return rendered
 
@@ -282,10 +503,36 @@ def _parse_repo_owner_name(repo_url: str):
 
  
 
+_http = threading.local()
+
+# Seconds to wait on GitHub API connects and reads; a stalled host must not hold
+# a worker (and a PR slot) forever.
+_HTTP_TIMEOUT = 30
+
+
+def _http_connection(scheme, netloc):
+    """Return this thread's persistent connection to scheme://netloc."""
+    import http.client
+    conns = getattr(_http, 'conns', None)
+    if conns is None:
+        conns = _http.conns = {}
+    conn = conns.get((scheme, netloc))
+    if conn is None:
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = conns[(scheme, netloc)] = cls(netloc, timeout=_HTTP_TIMEOUT)
+    return conn
+
+ 
+
+ 
+
 def _github_api_request(*, base_url: str, token: str, method: str, path: str, payload=None):
 
     """Make a GitHub Enterprise REST API request using a PAT."""
 
+    # Only needed when a PR is actually created, so keep them off the startup path.
+    import http.client, json, urllib.parse, urllib.request
+
     if not base_url.endswith('/'):
 
         base_url = base_url + '/'
@@ -316,11 +563,41 @@ def _github_api_request(*, base_url: str, token: str, method: str, path: str, pa
 
  
 
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or urllib.request.getproxies() and not urllib.request.proxy_bypass(parts.hostname or ''):
+        return _urlopen_request(url, data, headers, method)
+
+    # Reuse this thread's keep-alive connection, so repeated API calls to the
+    # same host skip the TCP and TLS handshakes.
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    for attempt in (1, 2):
+        conn = _http_connection(parts.scheme, parts.netloc)
+        # An open socket means the connection already served a request.
+        reused = conn.sock is not None
+        try:
+            conn.request(method, target, body=data, headers=headers)
+            resp = conn.getresponse()
+            return resp.status, resp.read().decode('utf-8')
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            _http.conns.pop((parts.scheme, parts.netloc), None)
+            # Only a reused keep-alive connection the server dropped before
+            # answering is retried. Anything else (timeouts, fresh connections,
+            # a partial response) may have reached the server, and re-sending a
+            # POST could create the PR twice.
+            if attempt == 2 or not reused or not isinstance(e, (ConnectionResetError, BrokenPipeError)):
+                raise
+
+
+
+def _urlopen_request(url, data, headers, method):
+    """One-shot request through urllib, which honours proxy settings."""
+    import urllib.error, urllib.request
     req = urllib.request.Request(url, data=data, headers=headers, method=method)
 
     try:
 
-        with urllib.request.urlopen(req) as resp:
+        with urllib.request.urlopen(req, timeout=_HTTP_TIMEOUT) as resp:
 
             body = resp.read().decode('utf-8')
 
@@ -336,6 +613,16 @@ def _github_api_request(*, base_url: str, token: str, method: str, path: str, pa
 
  
 
+# PR creation already overlaps across rows through the worker pool; cap how many
+# POSTs are in flight at once so a large --jobs doesn't trip GitHub's secondary
+# rate limits for content-creating requests.
+_MAX_CONCURRENT_PRS = 4
+_pr_slots = threading.BoundedSemaphore(_MAX_CONCURRENT_PRS)
+
+ 
+
+ 
+
 def _create_pull_request(*, base_url: str, token: str, owner: str, repo: str, title: str, body: str, head: str, base: str):
 
     """Create a PR via GitHub REST API.
@@ -358,19 +645,21 @@ def _create_pull_request(*, base_url: str, token: str, owner: str, repo: str, ti
 
     }
 
-    status, resp_body = _github_api_request(
+    with _pr_slots:
 
-        base_url=base_url,
+        status, resp_body = _github_api_request(
 
-        token=token,
+            base_url=base_url,
 
-        method='POST',
+            token=token,
 
-        path=f'/repos/{owner}/{repo}/pulls',
+            method='POST',
 
-        payload=payload,
+            path=f'/repos/{owner}/{repo}/pulls',
 
-    )
+            payload=payload,
+
+        )
 
     return status, resp_body
 
@@ -378,678 +667,755 @@ def _create_pull_request(*, base_url: str, token: str, owner: str, repo: str, ti
 
  
 
-def main():
-
-    p = argparse.ArgumentParser()
+# Optional CSV columns feeding the template tokens: (token, column, default).
+# Defaults mirror values-mct.yaml; None means the default is derived from the
+# row in load_rows().
+_TOKEN_COLUMNS = (
+    ('ENVIRONMENT', 'environment', 'mct'),
+    ('IMAGE_PULL_SECRET', 'imagePullSecret', 'docker-secret-agent'),
+    ('REPLICA_COUNT', 'replica_count', '1'),
+    ('IMAGE_PULL_POLICY', 'image_pull_policy', 'Always'),
+    ('LOGGING_AGENT_REPO', 'logging_agent_repo', None),
+    ('LOGGING_AGENT_TAG', 'logging_agent_tag', '1.0.0'),
+    ('MONITORING_AGENT_REPO', 'monitoring_agent_repo', None),
+    ('MONITORING_AGENT_TAG', 'monitoring_agent_tag', '1.0'),
+    ('APP_REQUEST_MEMORY', 'app_request_memory', '500Mi'),
+    ('APP_REQUEST_CPU', 'app_request_cpu', '150m'),
+    ('APP_LIMIT_MEMORY', 'app_limit_memory', '500Mi'),
+    ('APP_LIMIT_CPU', 'app_limit_cpu', '350m'),
+    ('LOG_REQUEST_CPU', 'log_request_cpu', '5m'),
+    ('LOG_REQUEST_MEMORY', 'log_request_memory', '128Mi'),
+    ('LOG_LIMIT_CPU', 'log_limit_cpu', '100m'),
+    ('LOG_LIMIT_MEMORY', 'log_limit_memory', '256Mi'),
+    ('MON_LIMIT_CPU', 'mon_limit_cpu', '80m'),
+    ('MON_LIMIT_MEMORY', 'mon_limit_memory', '850Mi'),
+    ('MON_REQUEST_CPU', 'mon_request_cpu', '80m'),
+    ('MON_REQUEST_MEMORY', 'mon_request_memory', '850Mi'),
+    ('SERVICE_TYPE', 'service_type', 'ClusterIP'),
+    ('SERVICE_PORT', 'service_port', '8080'),
+    ('SERVICE_TARGET_PORT', 'service_target_port', '8080'),
+    ('INGRESS_ENABLED', 'ingress_enabled', 'true'),
+    ('GIT_BRANCH', 'git_branch', ''),
+    ('SECONDARY_CLUSTER_ENABLED', 'secondary_cluster_enabled', 'false'),
+    ('PRIMARY_CLUSTER_ENABLED', 'primary_cluster_enabled', 'true'),
+    ('PRIMARY_CLUSTER_ENVIRONMENT', 'primary_cluster_environment', 'dev'),
+    ('PRIMARY_CLUSTER_MIN', 'primary_cluster_min', '1'),
+    ('PRIMARY_CLUSTER_MAX', 'primary_cluster_max', '1'),
+    ('PRIMARY_CLUSTER_CPU', 'primary_cluster_cpu', '55'),
+    ('PRIMARY_CLUSTER_MEM', 'primary_cluster_mem', '85'),
+    ('G3_ENV_MAP', 'g3_env_map', '- { env: RWI, rcwi: rcwi-rwi }\n- { env: PWI, rcwi: rcwi-pwi }\n- { env: RCWI, rcwi: rcwi-prod }'),
+    ('EIM', 'eim', ''),
+    ('APPLICATION_VERSION', 'application_version', '1.0.0'),
+    ('LOG_TRACE_ENABLED', 'log_trace_enabled', 'false'),
+    ('CONTAINER_IMAGE_TAG_DEFAULT', 'container_image_tag_default', ''),
+    ('NON_PROD_ENV_DEFAULT', 'non_prod_env_default', 'UAT'),
+    ('SNAPSHOT_DEFAULT', 'snapshot_default', '-SNAPSHOT'),
+    ('CR_NUMBER_DEFAULT', 'cr_number_default', ''),
+    ('JDK_PATH', 'jdk_path', '/usr/lib/jvm/default'),
+    ('MAVEN_PATH', 'maven_path', '/usr/lib/maven'),
+    ('JIRA_CREDENTIAL_ID', 'jira_credential_id', ''),
+    ('JIRA_HOST', 'jira_host', ''),
+    ('BUILD_ENABLED', 'build_enabled', 'false'),
+    ('NEXUS_ID', 'nexus_id', 'nexus3uk'),
+    ('NEXUS_JENKINS_CRED', 'nexus_jenkins_cred', 'GB-SVC-CDMS-SHP'),
+    ('POM_PATH', 'pom_path', './pom.xml'),
+    ('MAVEN_GOAL', 'maven_goal', 'clean install'),
+    ('CONTAINER_BUILD_TYPE', 'container_build_type', 'kaniko'),
+    ('REGISTRY_NEXUS', 'registry_nexus', None),
+    ('DOCKERFILE_LOCATION', 'dockerfile_location', '.'),
+    ('APPLICATION_IMAGE_NAME', 'application_image_name', None),
+    ('TAG_EXPR', 'tag_expr', '${params.container_image_tag}'),
+    ('DOCKER_JENKINS_CRED', 'docker_jenkins_cred', 'CDMS-SA-Docker-Config'),
+    ('IADP_ENABLED', 'iadp_enabled', 'false'),
+    ('IADP_CONTRACTS_PATH', 'iadp_contracts_path', 'api/contracts'),
+    ('PUBLISH_TO_ANY_ENABLED', 'publish_to_any_enabled', 'false'),
+    ('APIX_ENABLED', 'apix_enabled', 'false'),
+    ('G3_ENABLED', 'g3_enabled', 'true'),
+    ('G3_PROJECT_AREA', 'g3_project_area', 'Customer_Data_Mastering_Service'),
+    ('G3_APPLICATION_NAME', 'g3_application_name', 'CDMS-IKP'),
+    ('RWI_RELEASE_CONFIG_ID', 'rwi_release_config_id', '8087086'),
+    ('NAMESPACE', 'namespace', 'default'),
+)
+
+# Every template a row may render; main() resolves them to absolute paths once.
+# Helm templates rendered into helm-<app>/templates/, as (template, output) pairs.
+_HELM_TEMPLATE_PAIRS = (
+    ('deployment.yaml.tmpl', 'deployment.yaml'),
+    ('service.yaml.tmpl', 'service.yaml'),
+    ('ingress.yaml.tmpl', 'ingress.yaml'),
+    ('hpa.yaml.tmpl', 'hpa.yaml'),
+    ('serviceaccount.yaml.tmpl', 'serviceaccount.yaml'),
+)
+
+_TEMPLATE_NAMES = (
+    'ci-config.yaml.tmpl',
+    'ci-config.yaml.tmpl.jvm',
+    'Dockerfile.tmpl.python',
+    'Dockerfile.tmpl.jvm',
+    'entrypoint.sh.tmpl',
+    'entrypoint-appd.sh.tmpl',
+    'Chart.yaml.tmpl',
+    'values.yaml.tmpl',
+    *(src for src, _ in _HELM_TEMPLATE_PAIRS),
+    'PR_TEMPLATE.md.tmpl',
+)
+
+# Mandatory CSV fields: owners must provide critical Dockerfile and image info
+# plus the configmap/secret references used by deployment template.
+_REQUIRED_COLUMNS = (
+    'repoUrl',
+    'branch',
+    'imageRepo',
+    'appName',
+    'base_image',
+    'jar_file',
+    'cm_env_config_name',
+    'mongo_db_creds_secret_name',
+    'cm_db_config_name',
+    'ingress_hosts',
+    'service_port',
+    'service_target_port',
+)
+
+# Tokens that must not be empty (their columns have defaults, but may be blanked).
+_REQUIRED_TOKENS = ('NEXUS_JENKINS_CRED', 'DOCKER_JENKINS_CRED')
+
+# Other optional CSV columns read while processing a row.
+_COLUMN_DEFAULTS = {
+    'lang': 'jvm',
+    'skipLocalBuild': 'false',
+    'appd_enabled': 'false',
+    'expose_port': '8092',
+}
+
+# Every static default in one dict, so filling a row is a single merge. The
+# image-derived token columns (default None) are computed per row.
+_ROW_DEFAULTS = {
+    **{column: default for _, column, default in _TOKEN_COLUMNS if default is not None},
+    **_COLUMN_DEFAULTS,
+}
+
+# Flag columns the script itself branches on; load_rows() turns them into bools.
+# (Flags that are only rendered into templates, e.g. g3_enabled, stay strings.)
+_BOOL_COLUMNS = ('skipLocalBuild', 'appd_enabled')
+
+TRUTHY = frozenset({'true', '1', 'yes', 'y', 'on'})
+
+
+def as_bool(value):
+    return (value or '').strip().lower() in TRUTHY
+
+
+def fill_row(row):
+    """Return a CSV row (column -> value) with every optional column's default filled in.
+
+    As in the CSV, a column that is present but empty keeps its empty value; only
+    absent columns (including those past the end of a short row) get defaults.
+    """
+    image_repo = row.get('imageRepo') or ''
+    image_prefix = image_repo.rsplit('/', 1)[0]
+    derived = {
+        'logging_agent_repo': f"{image_prefix}/gcdu-splunk" if '/' in image_repo else image_repo,
+        'monitoring_agent_repo': f"{image_prefix}/datac-appd-agent-v1.8-24.7.1.36300" if '/' in image_repo else image_repo,
+        'registry_nexus': image_repo.split('/')[0] if '/' in image_repo else image_repo,
+        'application_image_name': row.get('appName'),
+    }
+    row = {**_ROW_DEFAULTS, **derived, **row}
+    for column in _BOOL_COLUMNS:
+        row[column] = as_bool(row[column])
+    return row
 
-    p.add_argument('--csv', default='agent-templates/apps.csv')
 
-    p.add_argument('--dry-run', action='store_true')
+_TOKEN_COLUMN_NAMES = {token: column for token, column, _ in _TOKEN_COLUMNS}
 
-    p.add_argument('--tmpdir')
 
-    p.add_argument('--git-api-base-url', default=os.environ.get('GIT_API_BASE_URL', 'https://alm-github.systems.uk.hsbc/api/v3/'))
+def row_problems(row):
+    """List why a raw CSV row (before fill_row()) can't be processed (empty if it can).
 
-    p.add_argument('--git-token', default=os.environ.get('GIT_TOKEN', os.environ.get('GITHUB_TOKEN', '')))
+    Required columns must be present and non-empty in the CSV itself, even those
+    that also have a token default (service_port, service_target_port). The
+    backend runs the same check to fail bad rows before invoking the script.
+    """
+    problems = []
+    missing_csv = [c for c in _REQUIRED_COLUMNS if not row.get(c)]
+    if missing_csv:
+        problems.append(f"missing required CSV columns {missing_csv}")
+    # Token columns may be left out (their defaults apply) but not blanked.
+    missing_tokens = [t for t in _REQUIRED_TOKENS if not row.get(_TOKEN_COLUMN_NAMES[t], _ROW_DEFAULTS.get(_TOKEN_COLUMN_NAMES[t]))]
+    if missing_tokens:
+        problems.append(f"missing required tokens {missing_tokens}")
+    return problems
 
-    args = p.parse_args()
 
- 
+def load_rows(csv_path):
+    """Read and validate the CSV, filling in every optional column's default.
 
-    tmpdir = args.tmpdir or tempfile.mkdtemp(prefix='agent-apply-')
+    Workers then only see fully-populated rows (see fill_row()).
 
-    template_dir = os.path.dirname(os.path.abspath(__file__))
+    Every row is validated before anything is cloned: if any row is missing a
+    required value the whole run stops, listing each bad row by line number.
+    appName must also be unique, since it names the row's workdir and branch.
+    """
+    rows, problems = [], []
+    app_lines = {}
+    # '-' reads the CSV from stdin, e.g. a spreadsheet the backend converted in memory.
+    from_stdin = csv_path == '-'
+    with open(sys.stdin.fileno() if from_stdin else csv_path, newline='', buffering=1 << 20, closefd=not from_stdin) as fh:
+        # Plain csv.reader: one zip into a dict per row, without DictReader's
+        # per-row bookkeeping. fill_row() merges the dict with the defaults anyway.
+        reader = csv.reader(fh)
+        header = next(reader, [])
+        last_line = reader.line_num
+        for values in reader:
+            line, last_line = last_line + 1, reader.line_num
+            if not values:
+                continue  # blank line
+            raw = dict(zip(header, values))
+            problems.extend(f"line {line} ({raw.get('repoUrl')}): {p}" for p in row_problems(raw))
+            row = fill_row(raw)
+            app = row.get('appName')
+            if app and app in app_lines:
+                problems.append(f"line {line} ({row.get('repoUrl')}): duplicate appName {app!r} (first on line {app_lines[app]})")
+            app_lines.setdefault(app, line)
+            rows.append(row)
+
+    if problems:
+        raise SystemExit(f"Invalid rows in {csv_path}; nothing was processed:\n" + '\n'.join(f" - {p}" for p in problems))
+    return rows
+
+ 
+
+ 
+
+# Minimum free space required before cloning into tmpfs instead of the default temp dir.
+_TMPFS_MIN_FREE = 2 * 1024 ** 3
+
+
+def _tmpfs_dir(path='/dev/shm', min_free=_TMPFS_MIN_FREE):
+    """Return a tmpfs directory for the clones if one is available with enough room.
+
+    Clone and checkout I/O is all transient, so keeping it in memory avoids disk
+    writes entirely. Returns None (system default temp dir) otherwise.
+    """
+    try:
+        if os.path.isdir(path) and shutil.disk_usage(path).free >= min_free:
+            return path
+    except OSError:
+        pass
+    return None
 
  
 
-    with open(args.csv) as fh:
-
-        reader = csv.DictReader(fh)
-
-        for row in reader:
-
-            repo = row['repoUrl']
-
-            branch = row['branch']
-
-            app = row['appName']
-
-            image_repo = row['imageRepo']
-
-            lang = row.get('lang','jvm')
-
-            skip_local = row.get('skipLocalBuild','false').lower()=='true'
-
  
 
-            # Mandatory CSV fields check: ensure owners provided critical Dockerfile and image info
-
-            # plus the configmap/secret references used by deployment template.
-
-            required_csv = [
-
-                'imageRepo',
-
-                'appName',
-
-                'base_image',
-
-                'jar_file',
-
-                'cm_env_config_name',
-
-                'mongo_db_creds_secret_name',
+def _process_row(row, template_paths, tmpdir, args, tag):
 
-                'cm_db_config_name',
+    repo = row['repoUrl']
 
-                'ingress_hosts',
+    branch = row['branch']
 
-                'service_port',
+    app = row['appName']
 
-                'service_target_port',
+    image_repo = row['imageRepo']
 
-            ]
+    lang = row['lang']
 
-            missing_csv = [c for c in required_csv if not row.get(c)]
-
-            if missing_csv:
-
-                print(f"Missing required CSV columns {missing_csv} for repo {repo}. Skipping this entry.")
-
-                continue
+    skip_local = row['skipLocalBuild']
 
  
 
-            workdir = os.path.join(tmpdir, app)
+    workdir = os.path.join(tmpdir, app)
 
-            print('Processing', app, repo)
+    log('Processing', app, repo)
 
  
 
-            run(['git','clone',repo,workdir])
-
-            run(['git','checkout',branch], cwd=workdir)
-
-            new_branch = f'auto/devx-templates/{app}'
-
- 
-
-            # If branch already exists on remote, reuse it (checkout + pull).
-
-            # Otherwise create it from the base branch.
+    new_branch = f'auto/devx-templates/{app}'
 
-            run(['git', 'fetch', '--prune', 'origin'], cwd=workdir)
+    # Whether the branch already exists on the remote only depends on the repo URL,
+    # so ask the server while the clone is running.
+    ls_remote = start([GIT, 'ls-remote', '--heads', repo, new_branch])
 
-            remote_head = run(['git', 'ls-remote', '--heads', 'origin', new_branch], cwd=workdir, capture=True)
+    # --quiet silences git's progress and status chatter on the network commands.
+    quiet = ['--quiet'] if args.quiet else []
 
-            if remote_head.stdout.strip():
-
-                print(f"Remote branch exists: {new_branch}. Checking out and pulling latest.")
-
-                run(['git', 'checkout', new_branch], cwd=workdir)
-
-                run(['git', 'pull', '--ff-only', 'origin', new_branch], cwd=workdir)
-
-            else:
+    # Only the tip of the base branch is needed to lay down templates and push
+    # (unless --no-shallow asks for full history).
+    clone = [GIT,'clone',*quiet,'--no-tags','--branch',branch,repo,workdir]
+    if args.shallow:
+        clone[2:2] = ['--depth=1','--single-branch']
+    try:
+        if skip_local:
+            # Nothing is built locally, so only the repo root and the chart directory
+            # are ever touched: skip blob downloads and check out just those paths.
+            # --sparse checks out the root right away, so widening the cone to the
+            # chart directory populates it without a separate checkout.
+            cloned = run(clone[:2] + ['--filter=blob:none','--sparse'] + clone[2:]).returncode == 0
+            if cloned:
+                run([GIT,'sparse-checkout','set','--cone',f'helm-{app}'], cwd=workdir)
+        else:
+            cloned = run(clone).returncode == 0
+    finally:
+        # Always reap the background lookup, even if the clone step raised.
+        remote_head, _ = ls_remote.communicate()
 
-                run(['git', 'checkout', '-b', new_branch], cwd=workdir)
+    if not cloned:
+        raise RuntimeError(f"git clone of {repo} (branch {branch}) failed; skipping this repo")
 
  
 
-            tokens = {
-
-                'APP_NAME': app,
-
-                'IMAGE_REPO': image_repo,
-
-                'TAG': datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+    # If branch already exists on remote, reuse it (fetch just that ref + checkout).
 
-                # values.yaml.tmpl tokens (defaults chosen to mirror values-mct.yaml)
+    # Otherwise create it from the base branch.
 
-                'ENVIRONMENT': row.get('environment', 'mct'),
+    if remote_head.strip():
 
-                'IMAGE_PULL_SECRET': row.get('imagePullSecret', 'docker-secret-agent'),
+        log(f"Remote branch exists: {new_branch}. Checking out its latest commit.")
 
-                'REPLICA_COUNT': row.get('replica_count', '1'),
+        # A single-branch clone does not track this ref; fetch it explicitly.
+        # FETCH_HEAD is already the remote tip, so there is nothing left to pull.
+        run([GIT, 'fetch', *quiet, *(['--depth=1'] if args.shallow else []), 'origin', new_branch], cwd=workdir)
+        run([GIT, 'checkout', '-b', new_branch, 'FETCH_HEAD'], cwd=workdir)
 
-                'IMAGE_PULL_POLICY': row.get('image_pull_policy', 'Always'),
+    else:
 
-                'LOGGING_AGENT_REPO': row.get('logging_agent_repo', f"{image_repo.rsplit('/', 1)[0]}/gcdu-splunk" if '/' in image_repo else image_repo),
+        checkout_new_branch(workdir, new_branch)
 
-                'LOGGING_AGENT_TAG': row.get('logging_agent_tag', '1.0.0'),
-
-                'MONITORING_AGENT_REPO': row.get('monitoring_agent_repo', f"{image_repo.rsplit('/', 1)[0]}/datac-appd-agent-v1.8-24.7.1.36300" if '/' in image_repo else image_repo),
-
-                'MONITORING_AGENT_TAG': row.get('monitoring_agent_tag', '1.0'),
-
-                'APP_REQUEST_MEMORY': row.get('app_request_memory', '500Mi'),
-
-                'APP_REQUEST_CPU': row.get('app_request_cpu', '150m'),
-
-                'APP_LIMIT_MEMORY': row.get('app_limit_memory', '500Mi'),
-
-                'APP_LIMIT_CPU': row.get('app_limit_cpu', '350m'),
-
-                'LOG_REQUEST_CPU': row.get('log_request_cpu', '5m'),
+ 
 
-                'LOG_REQUEST_MEMORY': row.get('log_request_memory', '128Mi'),
+    tokens = {token: row[column] for token, column, _ in _TOKEN_COLUMNS}
+    tokens['APP_NAME'] = app
+    tokens['IMAGE_REPO'] = image_repo
+    tokens['TAG'] = tag
 
-                'LOG_LIMIT_CPU': row.get('log_limit_cpu', '100m'),
+ 
 
-                'LOG_LIMIT_MEMORY': row.get('log_limit_memory', '256Mi'),
+    # Optional AppDynamics inputs for entrypoint.sh
 
-                'MON_LIMIT_CPU': row.get('mon_limit_cpu', '80m'),
+    # We use two templates:
 
-                'MON_LIMIT_MEMORY': row.get('mon_limit_memory', '850Mi'),
+    # - entrypoint.sh.tmpl (no AppD flags)
 
-                'MON_REQUEST_CPU': row.get('mon_request_cpu', '80m'),
+    # - entrypoint-appd.sh.tmpl (includes AppD flags)
 
-                'MON_REQUEST_MEMORY': row.get('mon_request_memory', '850Mi'),
+    appd_enabled = row['appd_enabled']
 
-                'SERVICE_TYPE': row.get('service_type', 'ClusterIP'),
+ 
 
-                'SERVICE_PORT': row.get('service_port', '8080'),
+    # Ingress hosts: CSV provides comma-separated hosts. We generate two YAML blocks:
 
-                'SERVICE_TARGET_PORT': row.get('service_target_port', '8080'),
+    # - INGRESS_HOSTS: list items under ingress.hosts
 
-                'INGRESS_ENABLED': row.get('ingress_enabled', 'true'),
+    # - INGRESS_TLS: list items under ingress.tls
 
-                'GIT_BRANCH': row.get('git_branch', ''),
+    raw_hosts = row.get('ingress_hosts', '')
 
-                'SECONDARY_CLUSTER_ENABLED': row.get('secondary_cluster_enabled', 'false'),
+    hosts = [h.strip() for h in raw_hosts.split(',') if h.strip()]
 
-                'PRIMARY_CLUSTER_ENABLED': row.get('primary_cluster_enabled', 'true'),
+    if not hosts:
 
-                'PRIMARY_CLUSTER_ENVIRONMENT': row.get('primary_cluster_environment', 'dev'),
+        # keep valid YAML even if user doesn't provide hosts
 
-                'PRIMARY_CLUSTER_MIN': row.get('primary_cluster_min', '1'),
+        tokens['INGRESS_HOSTS'] = '    []'
 
-                'PRIMARY_CLUSTER_MAX': row.get('primary_cluster_max', '1'),
+        tokens['INGRESS_TLS'] = '    []'
 
-                'PRIMARY_CLUSTER_CPU': row.get('primary_cluster_cpu', '55'),
+    else:
 
-                'PRIMARY_CLUSTER_MEM': row.get('primary_cluster_mem', '85'),
+        tokens['INGRESS_HOSTS'] = "\n".join(f"    - host: {h}\n      paths:\n        - path: /" for h in hosts)
 
-                'G3_ENV_MAP': row.get('g3_env_map','- { env: RWI, rcwi: rcwi-rwi }\n- { env: PWI, rcwi: rcwi-pwi }\n- { env: RCWI, rcwi: rcwi-prod }'),
+        tokens['INGRESS_TLS'] = "    - hosts:\n" + "\n".join(f"        - {h}" for h in hosts)
 
  
 
-                # ci-config specific tokens (optional, populated from CSV if present)
-
-                'EIM': row.get('eim',''),
-
-                'APPLICATION_VERSION': row.get('application_version','1.0.0'),
-
-                'LOG_TRACE_ENABLED': row.get('log_trace_enabled','false'),
-
-                'CONTAINER_IMAGE_TAG_DEFAULT': row.get('container_image_tag_default',''),
-
-                'NON_PROD_ENV_DEFAULT': row.get('non_prod_env_default','UAT'),
-
-                'SNAPSHOT_DEFAULT': row.get('snapshot_default','-SNAPSHOT'),
+    # Dockerfile-specific tokens: base_image and jar_file are mandatory (enforced above)
 
-                'CR_NUMBER_DEFAULT': row.get('cr_number_default',''),
+    tokens['BASE_IMAGE'] = row['base_image']
 
-                'JDK_PATH': row.get('jdk_path','/usr/lib/jvm/default'),
+    tokens['JAR_FILE'] = row['jar_file']
 
-                'MAVEN_PATH': row.get('maven_path','/usr/lib/maven'),
+    tokens['EXPOSE_PORT'] = row['expose_port']
 
-                'JIRA_CREDENTIAL_ID': row.get('jira_credential_id',''),
+ 
 
-                'JIRA_HOST': row.get('jira_host',''),
+    # Deployment template configmap/secret references
 
-                'BUILD_ENABLED': row.get('build_enabled','false'),
+    tokens['CM_ENV_CONFIG_NAME'] = row['cm_env_config_name']
 
-                'NEXUS_ID': row.get('nexus_id','nexus3uk'),
+    tokens['MONGO_DB_CREDS_SECRET_NAME'] = row['mongo_db_creds_secret_name']
 
-                'NEXUS_JENKINS_CRED': row.get('nexus_jenkins_cred','GB-SVC-CDMS-SHP'),
+    tokens['CM_DB_CONFIG_NAME'] = row['cm_db_config_name']
 
-                'POM_PATH': row.get('pom_path','./pom.xml'),
+ 
 
-                'MAVEN_GOAL': row.get('maven_goal','clean install'),
+    # choose templates
 
-                'CONTAINER_BUILD_TYPE': row.get('container_build_type','kaniko'),
+    if lang in ('python','py'):
 
-                'REGISTRY_NEXUS': row.get('registry_nexus', image_repo.split('/')[0] if '/' in image_repo else image_repo),
+        ci_tmpl='ci-config.yaml.tmpl'
 
-                'DOCKERFILE_LOCATION': row.get('dockerfile_location','.'),
+        docker_tmpl='Dockerfile.tmpl.python'
 
-                'APPLICATION_IMAGE_NAME': row.get('application_image_name', app),
+    else:
 
-                'TAG_EXPR': row.get('tag_expr','${params.container_image_tag}'),
+        ci_tmpl='ci-config.yaml.tmpl.jvm'
 
-                'DOCKER_JENKINS_CRED': row.get('docker_jenkins_cred','CDMS-SA-Docker-Config'),
+        docker_tmpl='Dockerfile.tmpl.jvm'
 
-                'IADP_ENABLED': row.get('iadp_enabled','false'),
+ 
 
-                'IADP_CONTRACTS_PATH': row.get('iadp_contracts_path','api/contracts'),
+    # Rendered text by output file, so the pre-PR checks need not read it back.
+    rendered = {}
 
-                'PUBLISH_TO_ANY_ENABLED': row.get('publish_to_any_enabled','false'),
+    # Indent multi-line G3_ENV_MAP for YAML block scalar in ci-config
 
-                'APIX_ENABLED': row.get('apix_enabled','false'),
+    if ci_tmpl == 'ci-config.yaml.tmpl':
 
-                'G3_ENABLED': row.get('g3_enabled','true'),
+        tokens_ci = dict(tokens)
 
-                'G3_PROJECT_AREA': row.get('g3_project_area','Customer_Data_Mastering_Service'),
+        g3_map = tokens_ci.get('G3_ENV_MAP', '')
 
-                'G3_APPLICATION_NAME': row.get('g3_application_name','CDMS-IKP'),
+        tokens_ci['G3_ENV_MAP'] = '\n'.join(('        ' + line) if line else '' for line in g3_map.splitlines())
 
-                'RWI_RELEASE_CONFIG_ID': row.get('rwi_release_config_id','8087086'),
+        rendered['ci-config.yaml'] = render_to(os.path.join(workdir,'ci-config.yaml'), template_paths[ci_tmpl], tokens_ci)
 
-                'NAMESPACE': row.get('namespace','default')
+    else:
 
-            }
+        rendered['ci-config.yaml'] = render_to(os.path.join(workdir,'ci-config.yaml'), template_paths[ci_tmpl], tokens)
 
  
 
-            # Optional AppDynamics inputs for entrypoint.sh
-
-            # We use two templates:
-
-            # - entrypoint.sh.tmpl (no AppD flags)
-
-            # - entrypoint-appd.sh.tmpl (includes AppD flags)
-
-            appd_enabled_raw = (row.get('appd_enabled', 'false') or '').strip().lower()
-
-            appd_enabled = appd_enabled_raw in ('true', 'yes', 'y', '1')
+    rendered['Dockerfile'] = render_to(os.path.join(workdir,'Dockerfile'), template_paths[docker_tmpl], tokens)
 
  
 
-            # Ingress hosts: CSV provides comma-separated hosts. We generate two YAML blocks:
+    # entrypoint.sh
 
-            # - INGRESS_HOSTS: list items under ingress.hosts
+    if appd_enabled:
 
-            # - INGRESS_TLS: list items under ingress.tls
+        tokens['APPD_ACCOUNT_NAME'] = row.get('appd_account_name', '') or 'hsbc1'
 
-            raw_hosts = row.get('ingress_hosts', '')
+        tokens['APPD_ACCOUNT_ACCESS_KEY'] = row.get('appd_account_access_key', '') or 'fb1f7622edf9'
 
-            hosts = [h.strip() for h in raw_hosts.split(',') if h.strip()]
+        tokens['APPD_APPLICATION_NAME'] = row.get('appd_application_name', '') or 'cdms-cddm-uk-prod'
 
-            if not hosts:
+        tokens['APPD_NODE_NAME'] = row.get('appd_node_name', '') or 'cdms-syncback-service-Node-1.0.1'
 
-                # keep valid YAML even if user doesn't provide hosts
+        entrypoint_template = 'entrypoint-appd.sh.tmpl'
 
-                tokens['INGRESS_HOSTS'] = '    []'
+    else:
 
-                tokens['INGRESS_TLS'] = '    []'
+        # Keep the plain entrypoint output clean: no AppD placeholders needed.
 
-            else:
+        tokens.pop('APPD_ACCOUNT_NAME', None)
 
-                host_items = []
+        tokens.pop('APPD_ACCOUNT_ACCESS_KEY', None)
 
-                for h in hosts:
+        tokens.pop('APPD_APPLICATION_NAME', None)
 
-                    host_items.extend([
+        tokens.pop('APPD_NODE_NAME', None)
 
-                        f"    - host: {h}",
-
-                        "      paths:",
-
-                        "        - path: /",
-
-                    ])
-
-                tokens['INGRESS_HOSTS'] = "\n".join(host_items)
+        entrypoint_template = 'entrypoint.sh.tmpl'
 
  
 
-                tls_items = ["    - hosts:"]
-
-                tls_items.extend([f"        - {h}" for h in hosts])
-
-                tokens['INGRESS_TLS'] = "\n".join(tls_items)
+    rendered['entrypoint.sh'] = render_to(os.path.join(workdir, 'entrypoint.sh'), template_paths[entrypoint_template], tokens, newline='\n')
 
  
 
-            # Dockerfile-specific tokens: base_image and jar_file are mandatory (enforced above)
-
-            tokens['BASE_IMAGE'] = row['base_image']
-
-            tokens['JAR_FILE'] = row['jar_file']
+    # write helm chart: always create helm-<appName>/ with Chart.yaml, values.yaml,
 
-            tokens['EXPOSE_PORT'] = row.get('expose_port','8092')
+    # and templates/ (service/ingress/hpa/serviceaccount)
 
- 
-
-            # Deployment template configmap/secret references
+    chart_dir = os.path.join(workdir, f"helm-{app}")
 
-            tokens['CM_ENV_CONFIG_NAME'] = row['cm_env_config_name']
+    os.makedirs(chart_dir, exist_ok=True)
 
-            tokens['MONGO_DB_CREDS_SECRET_NAME'] = row['mongo_db_creds_secret_name']
+    rendered['Chart.yaml'] = render_to(os.path.join(chart_dir,'Chart.yaml'), template_paths['Chart.yaml.tmpl'], tokens)
 
-            tokens['CM_DB_CONFIG_NAME'] = row['cm_db_config_name']
+    rendered['values.yaml'] = render_to(os.path.join(chart_dir,'values.yaml'), template_paths['values.yaml.tmpl'], tokens)
 
  
 
-            # fail-fast checks for required tokens
-
-            required_tokens = ['NEXUS_JENKINS_CRED','DOCKER_JENKINS_CRED']
-
-            missing = [t for t in required_tokens if not tokens.get(t)]
+    templates_dir = os.path.join(chart_dir, 'templates')
 
-            if missing:
-
-                print(f"Missing required tokens: {missing}. Aborting for {app}.")
-
-                continue
+    os.makedirs(templates_dir, exist_ok=True)
 
  
 
-            # choose templates
-
-            if lang in ('python','py'):
-
-                ci_tmpl='ci-config.yaml.tmpl'
+    # Render additional helm templates.
 
-                docker_tmpl='Dockerfile.tmpl.python'
+    # These contain Helm double-curly blocks; only @@APP_NAME@@ (and any other @@TOKENS@@)
 
-            else:
+    # are substituted by our stdlib templater.
 
-                ci_tmpl='ci-config.yaml.tmpl.jvm'
+    for src_name, out_name in _HELM_TEMPLATE_PAIRS:
 
-                docker_tmpl='Dockerfile.tmpl.jvm'
+        rendered[out_name] = render_to(os.path.join(templates_dir, out_name), template_paths[src_name], tokens)
 
  
 
-            # Indent multi-line G3_ENV_MAP for YAML block scalar in ci-config
-
-            if ci_tmpl == 'ci-config.yaml.tmpl':
-
-                tokens_ci = dict(tokens)
-
-                g3_map = tokens_ci.get('G3_ENV_MAP', '')
-
-                tokens_ci['G3_ENV_MAP'] = '\n'.join(('        ' + line) if line else '' for line in g3_map.splitlines())
-
-                ci_out = render_template(template_dir, ci_tmpl, tokens_ci)
-
-            else:
-
-                ci_out = render_template(template_dir, ci_tmpl, tokens)
-
-            with open(os.path.join(workdir,'ci-config.yaml'),'w') as fh_out:
-
-                fh_out.write(ci_out)
+    log(f"Created chart directory and wrote Chart.yaml and values.yaml to: {chart_dir}")
 
  
 
-            docker_out = render_template(template_dir, docker_tmpl, tokens)
-
-            with open(os.path.join(workdir,'Dockerfile'),'w') as fh_out:
-
-                fh_out.write(docker_out)
+    rendered['PR_BODY.md'] = render_to(os.path.join(workdir,'PR_BODY.md'), template_paths['PR_TEMPLATE.md.tmpl'], {'APP_NAME':app,'DOCKER_RESULT':'pending','HELM_RESULT':'pending','TEST_RESULT':'pending'})
 
  
 
-            # entrypoint.sh
-
-            if appd_enabled:
-
-                tokens['APPD_ACCOUNT_NAME'] = row.get('appd_account_name', '') or 'hsbc1'
+    if not args.dry_run:
 
-                tokens['APPD_ACCOUNT_ACCESS_KEY'] = row.get('appd_account_access_key', '') or 'fb1f7622edf9'
+        # Pre-PR checks: keep it lightweight.
 
-                tokens['APPD_APPLICATION_NAME'] = row.get('appd_application_name', '') or 'cdms-cddm-uk-prod'
+        # No Maven build, no Docker build, no Helm lint required.
 
-                tokens['APPD_NODE_NAME'] = row.get('appd_node_name', '') or 'cdms-syncback-service-Node-1.0.1'
+        checks = []
 
-                entrypoint_template = 'entrypoint-appd.sh.tmpl'
+        checks.append(('ci-config.yaml (yaml)',) + _yaml_syntax_check(rendered['ci-config.yaml']))
 
-            else:
+        checks.append((f'helm-{app}/Chart.yaml (yaml)',) + _yaml_syntax_check(rendered['Chart.yaml']))
 
-                # Keep the plain entrypoint output clean: no AppD placeholders needed.
+        checks.append((f'helm-{app}/values.yaml (yaml)',) + _yaml_syntax_check(rendered['values.yaml']))
 
-                tokens.pop('APPD_ACCOUNT_NAME', None)
+        # These are Helm templates; do placeholder guardrails (not YAML parse).
 
-                tokens.pop('APPD_ACCOUNT_ACCESS_KEY', None)
+        for _, out_name in _HELM_TEMPLATE_PAIRS:
+            checks.append((f'helm-{app}/templates/{out_name} (placeholders)',) + _text_guardrails(rendered[out_name], forbidden_substrings=['@@']))
 
-                tokens.pop('APPD_APPLICATION_NAME', None)
+        # Dockerfile: ensure it doesn't still have unresolved placeholders.
 
-                tokens.pop('APPD_NODE_NAME', None)
+        checks.append(('Dockerfile (placeholders)',) + _text_guardrails(rendered['Dockerfile'], forbidden_substrings=['@@']))
 
-                entrypoint_template = 'entrypoint.sh.tmpl'
+        checks.append(('entrypoint.sh (placeholders)',) + _text_guardrails(rendered['entrypoint.sh'], forbidden_substrings=['@@']))
 
  
 
-            entrypoint_out = render_template(template_dir, entrypoint_template, tokens)
-
-            with open(os.path.join(workdir, 'entrypoint.sh'), 'w', encoding='utf-8', newline='\n') as fh_out:
-
-                fh_out.write(entrypoint_out)
-
- 
+        failed = [(name, msg) for (name, ok, msg) in checks if not ok]
 
-            # write helm chart: always create helm-<appName>/ with Chart.yaml, values.yaml,
+        for (name, ok, msg) in checks:
 
-            # and templates/ (service/ingress/hpa/serviceaccount)
+            log(f"CHECK: {name}: {'PASS' if ok else 'FAIL'} ({msg})")
 
-            values_content = render_template(template_dir, 'values.yaml.tmpl', tokens)
+        if failed:
 
-            chart_dir = os.path.join(workdir, f"helm-{app}")
+            log('One or more syntax checks failed; skipping commit/push/PR for this repo:')
 
-            os.makedirs(chart_dir, exist_ok=True)
+            for name, msg in failed:
 
-            chart_yaml = render_template(template_dir, 'Chart.yaml.tmpl', tokens)
+                log(f" - {name}: {msg}")
 
-            with open(os.path.join(chart_dir,'Chart.yaml'),'w') as fh_chart:
-
-                fh_chart.write(chart_yaml)
-
-            with open(os.path.join(chart_dir,'values.yaml'),'w') as fh_out:
-
-                fh_out.write(values_content)
-
- 
-
-            templates_dir = os.path.join(chart_dir, 'templates')
-
-            os.makedirs(templates_dir, exist_ok=True)
+            return
 
  
 
-            # Render additional helm templates.
-
-            # These contain Helm double-curly blocks; only @@APP_NAME@@ (and any other @@TOKENS@@)
+        commit_paths(workdir, [
 
-            # are substituted by our stdlib templater.
+            'ci-config.yaml',
 
-            for src_name, out_name in [
+            'Dockerfile',
 
-                ('deployment.yaml.tmpl', 'deployment.yaml'),
+            'entrypoint.sh',
 
-                ('service.yaml.tmpl', 'service.yaml'),
+            os.path.join(f'helm-{app}','Chart.yaml'),
 
-                ('ingress.yaml.tmpl', 'ingress.yaml'),
+            os.path.join(f'helm-{app}','values.yaml'),
 
-                ('hpa.yaml.tmpl', 'hpa.yaml'),
+            *(os.path.join(f'helm-{app}','templates',out_name) for _, out_name in _HELM_TEMPLATE_PAIRS),
 
-                ('serviceaccount.yaml.tmpl', 'serviceaccount.yaml'),
+            'PR_BODY.md'
 
-            ]:
+        ], f"add DevX/IKP templates for {app}")
 
-                rendered = render_template(template_dir, src_name, tokens)
-
-                with open(os.path.join(templates_dir, out_name), 'w', encoding='utf-8') as fh_tpl:
-
-                    fh_tpl.write(rendered)
+        pushed = run([GIT,'push',*quiet,'-u','origin',new_branch], cwd=workdir).returncode == 0
 
  
 
-            print(f"Created chart directory and wrote Chart.yaml and values.yaml to: {chart_dir}")
-
- 
+        # Create PR via Git REST API (GitHub Enterprise) using a token.
 
-            pr_body = render_template(template_dir, 'PR_TEMPLATE.md.tmpl', {'APP_NAME':app,'DOCKER_RESULT':'pending','HELM_RESULT':'pending','TEST_RESULT':'pending'})
+        if not args.git_token:
 
-            with open(os.path.join(workdir,'PR_BODY.md'),'w') as fh_out:
+            log('GIT token not provided (use --git-token or env GIT_TOKEN/GITHUB_TOKEN); please create PR manually')
 
-                fh_out.write(pr_body)
+        else:
 
- 
+            try:
 
-            if not args.dry_run:
+                owner, repo_name = _parse_repo_owner_name(repo)
 
-                # Pre-PR checks: keep it lightweight.
+                pr_body_text = rendered['PR_BODY.md']
 
-                # No Maven build, no Docker build, no Helm lint required.
+ 
 
-                checks = []
+                # For GitHub API, head may be either "branch" (same repo) or "owner:branch".
 
-                checks.append(('ci-config.yaml (yaml)',) + _yaml_syntax_check(os.path.join(workdir, 'ci-config.yaml')))
+                # Using "owner:branch" is explicit and works for same-repo PRs.
 
-                checks.append((f'helm-{app}/Chart.yaml (yaml)',) + _yaml_syntax_check(os.path.join(chart_dir, 'Chart.yaml')))
+                head_ref = f"{owner}:{new_branch}"
 
-                checks.append((f'helm-{app}/values.yaml (yaml)',) + _yaml_syntax_check(os.path.join(chart_dir, 'values.yaml')))
+                title = f"Feat: add DevX/IKP templates for {app}"
 
-                # These are Helm templates; do placeholder guardrails (not YAML parse).
+ 
 
-                checks.append((f'helm-{app}/templates/deployment.yaml (placeholders)',) + _text_guardrails(os.path.join(templates_dir, 'deployment.yaml'), forbidden_substrings=['@@']))
+                status, resp_body = _create_pull_request(
 
-                checks.append((f'helm-{app}/templates/service.yaml (placeholders)',) + _text_guardrails(os.path.join(templates_dir, 'service.yaml'), forbidden_substrings=['@@']))
+                    base_url=args.git_api_base_url,
 
-                checks.append((f'helm-{app}/templates/ingress.yaml (placeholders)',) + _text_guardrails(os.path.join(templates_dir, 'ingress.yaml'), forbidden_substrings=['@@']))
+                    token=args.git_token,
 
-                checks.append((f'helm-{app}/templates/hpa.yaml (placeholders)',) + _text_guardrails(os.path.join(templates_dir, 'hpa.yaml'), forbidden_substrings=['@@']))
+                    owner=owner,
 
-                checks.append((f'helm-{app}/templates/serviceaccount.yaml (placeholders)',) + _text_guardrails(os.path.join(templates_dir, 'serviceaccount.yaml'), forbidden_substrings=['@@']))
+                    repo=repo_name,
 
-                # Dockerfile: ensure it doesn't still have unresolved placeholders.
+                    title=title,
 
-                checks.append(('Dockerfile (placeholders)',) + _text_guardrails(os.path.join(workdir, 'Dockerfile'), forbidden_substrings=['@@'] ))
+                    body=pr_body_text,
 
-                checks.append(('entrypoint.sh (placeholders)',) + _text_guardrails(os.path.join(workdir, 'entrypoint.sh'), forbidden_substrings=['@@'] ))
+                    head=head_ref,
 
- 
+                    base=branch,
 
-                failed = [(name, msg) for (name, ok, msg) in checks if not ok]
+                )
 
-                for (name, ok, msg) in checks:
+                if status in (200, 201):
 
-                    print(f"CHECK: {name}: {'PASS' if ok else 'FAIL'} ({msg})")
+                    # Parse response to get PR URL
+                    import json
 
-                if failed:
+                    try:
+                        pr_data = json.loads(resp_body)
+                        pr_url = pr_data.get('html_url', '')
+                        pr_number = pr_data.get('number', '')
+                        if pr_url:
+                            log(f'PR created successfully: {pr_url}')
+                            log(f'PR_URL={pr_url}')  # Machine-readable format for backend parsing
+                        else:
+                            log('PR created successfully')
+                    except:
+                        log('PR created successfully')
 
-                    print('One or more syntax checks failed; skipping commit/push/PR for this repo:')
+                else:
 
-                    for name, msg in failed:
+                    log(f"PR creation failed (HTTP {status}). Response: {resp_body}")
 
-                        print(f" - {name}: {msg}")
+            except Exception as e:
 
-                    continue
+                log(f"PR creation failed due to error: {e}. Please create PR manually.")
 
  
 
-                run([
-
-                    'git','add',
-
-                    'ci-config.yaml',
-
-                    'Dockerfile',
-
-                    'entrypoint.sh',
-
-                    os.path.join(f'helm-{app}','Chart.yaml'),
+        # Everything is on the remote branch now; free the clone's disk space.
+        if pushed and not args.keep_workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
 
-                    os.path.join(f'helm-{app}','values.yaml'),
+ 
 
-                    os.path.join(f'helm-{app}','templates','deployment.yaml'),
+def process_row(row, template_paths, tmpdir, args, tag):
+    """Apply the templates to one CSV row's repo.
 
-                    os.path.join(f'helm-{app}','templates','service.yaml'),
+    Output is buffered for the duration of the row and flushed as a single block,
+    so concurrent workers never interleave their lines (the backend splits the
+    script output on "Processing <app>" markers). A failure is logged inside that
+    block too; returns False if the row failed.
+    """
+    _row_output.lines = []
+    try:
+        _process_row(row, template_paths, tmpdir, args, tag)
+        return True
+    except Exception as e:
+        log(f"ERROR: processing {row.get('appName')} ({row.get('repoUrl')}) failed: {e}")
+        with _print_lock:
+            traceback.print_exc()
+        return False
+    finally:
+        lines, _row_output.lines = _row_output.lines, None
+        if lines:
+            with _print_lock:
+                print('\n'.join(lines), flush=True)
 
-                    os.path.join(f'helm-{app}','templates','ingress.yaml'),
+ 
 
-                    os.path.join(f'helm-{app}','templates','hpa.yaml'),
+def main():
 
-                    os.path.join(f'helm-{app}','templates','serviceaccount.yaml'),
+    p = argparse.ArgumentParser()
 
-                    'PR_BODY.md'
+    p.add_argument('--csv', default='agent-templates/apps.csv')
 
-                ], cwd=workdir)
+    p.add_argument('--dry-run', action='store_true')
 
-                run(['git','commit','-m',f"add DevX/IKP templates for {app}"], cwd=workdir)
+    p.add_argument('--tmpdir')
 
-                run(['git','push','-u','origin',new_branch], cwd=workdir)
+    p.add_argument('--no-tmpfs', action='store_true')
 
- 
+    p.add_argument('--no-shallow', dest='shallow', action='store_false')
 
-                # Create PR via Git REST API (GitHub Enterprise) using a token.
+    p.add_argument('--keep-workdirs', action='store_true')
 
-                if not args.git_token:
+    p.add_argument('--verbose', '-v', action='store_true')
 
-                    print('GIT token not provided (use --git-token or env GIT_TOKEN/GITHUB_TOKEN); please create PR manually')
+    p.add_argument('--quiet', '-q', action='store_true')
 
-                else:
+    p.add_argument('--jobs', '-j', type=int)
 
-                    try:
+    p.add_argument('--git-api-base-url', default=os.environ.get('GIT_API_BASE_URL', 'https://alm-github.systems.uk.hsbc/api/v3/'))
 
-                        owner, repo_name = _parse_repo_owner_name(repo)
+    p.add_argument('--git-token', default=os.environ.get('GIT_TOKEN', os.environ.get('GITHUB_TOKEN', '')))
 
-                        with open(os.path.join(workdir, 'PR_BODY.md'), 'r', encoding='utf-8') as fh:
+    args = p.parse_args()
 
-                            pr_body_text = fh.read()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format='%(message)s')
 
  
 
-                        # For GitHub API, head may be either "branch" (same repo) or "owner:branch".
+    # Validate the whole CSV before creating anything or cloning.
+    rows = load_rows(args.csv)
 
-                        # Using "owner:branch" is explicit and works for same-repo PRs.
+    tmpdir = args.tmpdir
+    shm = None
+    if not tmpdir:
+        import tempfile
+        # Workdirs that are always left behind for inspection belong on disk, not in RAM.
+        if not (args.no_tmpfs or args.keep_workdirs or args.dry_run):
+            shm = _tmpfs_dir()
+        tmpdir = tempfile.mkdtemp(prefix='agent-apply-', dir=shm)
 
-                        head_ref = f"{owner}:{new_branch}"
+    template_dir = os.path.dirname(os.path.abspath(__file__))
 
-                        title = f"Feat: add DevX/IKP templates for {app}"
+    template_paths = {name: os.path.join(template_dir, name) for name in _TEMPLATE_NAMES}
 
  
 
-                        status, resp_body = _create_pull_request(
-
-                            base_url=args.git_api_base_url,
-
-                            token=args.git_token,
-
-                            owner=owner,
-
-                            repo=repo_name,
-
-                            title=title,
-
-                            body=pr_body_text,
-
-                            head=head_ref,
-
-                            base=branch,
-
-                        )
-
-                        if status in (200, 201):
-
-                            # Parse response to get PR URL
-                            try:
-                                pr_data = json.loads(resp_body)
-                                pr_url = pr_data.get('html_url', '')
-                                pr_number = pr_data.get('number', '')
-                                if pr_url:
-                                    print(f'PR created successfully: {pr_url}')
-                                    print(f'PR_URL={pr_url}')  # Machine-readable format for backend parsing
-                                else:
-                                    print('PR created successfully')
-                            except:
-                                print('PR created successfully')
-
-                        else:
-
-                            print(f"PR creation failed (HTTP {status}). Response: {resp_body}")
-
-                    except Exception as e:
+    # One image tag for the whole run, so every repo in a batch shares it.
+    tag = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
 
-                        print(f"PR creation failed due to error: {e}. Please create PR manually.")
+    # Each row works in its own workdir, so rows can be processed concurrently;
+    # the work is dominated by git network I/O and subprocesses.
+    # There is no point in more workers than rows.
+    workers = max(1, min(args.jobs or min(8, (os.cpu_count() or 4) * 3 // 4), len(rows)))
+    if workers == 1:
+        # A single row (or --jobs 1) has nothing to overlap; skip the pool.
+        results = [process_row(row, template_paths, tmpdir, args, tag) for row in rows]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_row, row, template_paths, tmpdir, args, tag) for row in rows]
+            results = [future.result() for future in futures]
+    failures = results.count(False)
 
  
 
     if args.tmpdir is None:
 
-        print('Leaving tempdir for inspection:', tmpdir)
+        try:
+            # Every clone was pushed and removed; nothing left to inspect.
+            os.rmdir(tmpdir)
+        except OSError:
+            if shm:
+                # Rows that failed left their clones behind; move them out of tmpfs
+                # so repeated runs don't pile them up in memory.
+                tmpdir = shutil.move(tmpdir, tempfile.gettempdir())
+            print('Leaving tempdir for inspection:', tmpdir)
+
+    if failures:
+        sys.exit(1)
 
  
 
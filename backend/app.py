@@ -2,15 +2,33 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 import csv
+import io
+import locale
+import functools
+import importlib.util
 import tempfile
 import subprocess
+import sys
 import shutil
 from werkzeug.utils import secure_filename
 import pandas as pd
+from openpyxl import load_workbook
+try:
+    # Optional: Rust-backed reader, much faster and leaner than openpyxl/xlrd
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+try:
+    # Optional: decodes multipart uploads much faster than Werkzeug's form parser
+    from streaming_form_data import ParseFailedException, StreamingFormDataParser
+    from streaming_form_data.targets import FileTarget, ValueTarget
+except ImportError:
+    StreamingFormDataParser = None
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-import re
-import time
+from urllib.parse import urlsplit
 import urllib3
 
 # Disable SSL warnings when using verify=False
@@ -24,12 +42,94 @@ ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Uploads are copied to disk in 1 MiB chunks (Werkzeug defaults to 16 KiB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN', '')
+# Support both old (token) and new (Bearer) GitHub auth formats
+_AUTH_HEADER = f'Bearer {GITHUB_TOKEN}' if GITHUB_TOKEN.startswith(('ghp_', 'github_pat_')) else f'token {GITHUB_TOKEN}'
+
+# How many repos agent-apply.py processes (clone, push, create PR) concurrently;
+# empty leaves it to the script's own default.
+AGENT_APPLY_JOBS = os.environ.get('AGENT_APPLY_JOBS', '')
+
+# One pooled session for all GitHub API calls, so PRs against the same host reuse
+# the TCP+TLS connection. The adapter keeps a separate pool per host, which
+# covers github.com and enterprise hosts alike. Retry only re-sends POSTs on
+# connection errors, never after a response, so a PR is not created twice.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+))
+SESSION.headers.update({
+    'Accept': 'application/vnd.github.v3+json',
+    'User-Agent': 'hdpv2-automation-tool',
+    'X-GitHub-Api-Version': '2022-11-28'
+})
+if GITHUB_TOKEN:
+    SESSION.headers['Authorization'] = _AUTH_HEADER
+
+# Backend is in agent-templates/Backend/, script is in agent-templates/
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'agent-apply.py')
+
+@functools.lru_cache(maxsize=1)
+def load_script_module():
+    """Import agent-apply.py, the source of truth for which rows are valid"""
+    spec = importlib.util.spec_from_file_location('agent_apply', SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def row_problems(values):
+    """Why agent-apply.py would reject a row (column -> value); empty if it is valid.
+    
+    The script rejects the whole CSV if any row is invalid, so such rows are
+    failed here and left out of the script run.
+    """
+    try:
+        script = load_script_module()
+    except OSError:
+        # Script missing: run_automation_script() reports it
+        return []
+    return script.row_problems(values)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _excel_cell(value):
+    """Normalize a spreadsheet cell for CSV output"""
+    if value is None:
+        return ''
+    # calamine returns every number as float; keep ports, counts etc. as integers
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def excel_to_csv(excel_path, out):
+    """Stream the first sheet of an .xlsx/.xls workbook as CSV into a text file object, row by row"""
+    if CalamineWorkbook is not None:
+        wb = CalamineWorkbook.from_path(excel_path)
+        rows = wb.get_sheet_by_index(0).iter_rows()
+    elif excel_path.endswith('.xls'):
+        # Legacy .xls is not supported by openpyxl; read it through pandas/xlrd
+        df = pd.read_excel(excel_path)
+        df.to_csv(out, index=False)
+        return
+    else:
+        wb = load_workbook(excel_path, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+    try:
+        writer = csv.writer(out)
+        for row in rows:
+            # Skip fully empty rows (sheets can report trailing blanks)
+            if any(v is not None and v != '' for v in row):
+                writer.writerow(_excel_cell(v) for v in row)
+    finally:
+        wb.close()
+
+@functools.lru_cache(maxsize=128)
 def parse_github_url(repo_url):
     """Extract owner and repo name from GitHub URL"""
     parts = repo_url.rstrip('/').split('/')
@@ -37,36 +137,28 @@ def parse_github_url(repo_url):
     repo = parts[-1].replace('.git', '')
     return owner, repo
 
+@functools.lru_cache(maxsize=128)
+def resolve_api_base(repo_url):
+    """Determine the GitHub API base URL for a repo (supports enterprise GitHub)"""
+    # Drop any credentials; the port, if given, stays part of the host
+    host = urlsplit(repo_url).netloc.rpartition('@')[2]
+    if not host or host == 'github.com':
+        return 'https://api.github.com'
+    # Enterprise GitHub (e.g., alm-github.systems.uk.hsbc)
+    return f'https://{host}/api/v3'
+
+@functools.lru_cache(maxsize=128)
+def pulls_api_url(repo_url):
+    """REST endpoint for creating PRs in the given repo"""
+    owner, repo = parse_github_url(repo_url)
+    return f'{resolve_api_base(repo_url)}/repos/{owner}/{repo}/pulls'
+
 def create_github_pr(repo_url, branch, new_branch, title, body):
     """Create a PR using GitHub API"""
     if not GITHUB_TOKEN:
         return {'success': False, 'error': 'GitHub token not configured'}
     
-    owner, repo = parse_github_url(repo_url)
-    
-    # Determine GitHub API base URL (support enterprise GitHub)
-    if 'github.com' in repo_url:
-        api_base = 'https://api.github.com'
-    else:
-        # Extract domain for enterprise GitHub (e.g., alm-github.systems.uk.hsbc)
-        domain_match = re.search(r'https?://([^/]+)', repo_url)
-        if domain_match:
-            domain = domain_match.group(1)
-            api_base = f'https://{domain}/api/v3'
-        else:
-            api_base = 'https://api.github.com'
-    
-    api_url = f'{api_base}/repos/{owner}/{repo}/pulls'
-    
-    # Support both old (token) and new (Bearer) GitHub auth formats
-    auth_header = f'Bearer {GITHUB_TOKEN}' if GITHUB_TOKEN.startswith(('ghp_', 'github_pat_')) else f'token {GITHUB_TOKEN}'
-    
-    headers = {
-        'Authorization': auth_header,
-        'Accept': 'application/vnd.github.v3+json',
-        'User-Agent': 'hdpv2-automation-tool',
-        'X-GitHub-Api-Version': '2022-11-28'
-    }
+    api_url = pulls_api_url(repo_url)
     
     data = {
         'title': title,
@@ -76,7 +168,7 @@ def create_github_pr(repo_url, branch, new_branch, title, body):
     }
     
     try:
-        response = requests.post(api_url, headers=headers, json=data, verify=False)
+        response = SESSION.post(api_url, json=data, verify=False, timeout=(5, 30))
         if response.status_code == 201:
             pr_data = response.json()
             return {
@@ -101,11 +193,8 @@ def parse_script_output(output, repos):
     
     print(f"DEBUG parse_script_output: Total lines in output: {len(lines)}")
     
-    # For each repo, find its section in the output and check PR status
-    for repo in repos:
-        app_name = repo.get('appName', 'Unknown')
-        repo_url = repo.get('repoUrl', 'Unknown')
-        
+    # For each (app_name, repo_url), find its section in the output and check PR status
+    for app_name, repo_url in repos:
         print(f"DEBUG: Looking for app_name='{app_name}' in output")
         
         # Find the line index where this app starts being processed
@@ -138,7 +227,15 @@ def parse_script_output(output, repos):
         app_output = '\n'.join(lines[processing_line_idx:next_processing_idx])
         
         # Check PR status in this app's section
-        if 'PR created successfully' in app_output:
+        error_line = next((line for line in app_output.split('\n') if line.startswith('ERROR: processing ')), None)
+        if error_line:
+            # The script failed on this repo (e.g. clone failed); it logs the error in the app's section
+            results.append({
+                'repo': f"{app_name} ({repo_url})",
+                'success': False,
+                'error': error_line.strip()
+            })
+        elif 'PR created successfully' in app_output:
             # Extract PR URL if available (format: PR_URL=https://...)
             pr_url = None
             for line in app_output.split('\n'):
@@ -182,11 +279,10 @@ def parse_script_output(output, repos):
     
     return results
 
-def run_automation_script(csv_path, dry_run=False):
-    # Backend is in agent-templates/Backend/, script is in agent-templates/
-    backend_dir = os.path.dirname(os.path.abspath(__file__))  # .../Backend/
-    agent_templates_dir = os.path.dirname(backend_dir)  # .../agent-templates/
-    script_path = os.path.join(agent_templates_dir, 'agent-apply.py')
+def run_automation_script(csv_path, dry_run=False, jobs=None, csv_text=None):
+    # csv_text, when given, is piped to the script on stdin instead of reading csv_path
+    script_path = SCRIPT_PATH
+    agent_templates_dir = os.path.dirname(script_path)
     
     # Check if script exists
     if not os.path.exists(script_path):
@@ -195,22 +291,29 @@ def run_automation_script(csv_path, dry_run=False):
             'error': f'Script not found at: {script_path}. Please ensure agent-apply.py exists in {agent_templates_dir}'
         }
     
-    # Use 'python' on Windows, 'python3' on Unix
-    python_cmd = 'python' if os.name == 'nt' else 'python3'
+    # Run the script with the backend's own interpreter: no PATH lookup, and it
+    # sees the same installed optional packages (PyYAML, pygit2)
+    python_cmd = sys.executable or ('python' if os.name == 'nt' else 'python3')
     
-    cmd = [python_cmd, script_path, '--csv', csv_path]
+    cmd = [python_cmd, script_path, '--csv', '-' if csv_text is not None else csv_path]
     if dry_run:
         cmd.append('--dry-run')
+    jobs = jobs or AGENT_APPLY_JOBS
+    if jobs:
+        cmd.extend(['--jobs', str(jobs)])
     
     try:
         # Use Popen for better compatibility across Python versions
         # Don't set cwd - let the script handle its own directory resolution
         process = subprocess.Popen(
             cmd,
+            stdin=subprocess.PIPE if csv_text is not None else None,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
-        stdout, stderr = process.communicate(timeout=600)
+        # The script reads stdin with the locale's default encoding, as it would a file
+        csv_input = csv_text.encode(locale.getpreferredencoding(False)) if csv_text is not None else None
+        stdout, stderr = process.communicate(input=csv_input, timeout=600)
         
         # Decode bytes to string
         stdout_str = stdout.decode('utf-8') if isinstance(stdout, bytes) else stdout
@@ -238,16 +341,53 @@ def run_automation_script(csv_path, dry_run=False):
             'error': f'Execution error: {str(e)}'
         }
 
-def process_csv_data(csv_path):
+def process_csv_data(csv_path, jobs=None, csv_text=None):
     try:
-        with open(csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            repos = list(reader)
+        with (open(csv_path, 'r', newline='') if csv_text is None else io.StringIO(csv_text, newline='')) as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            # Only these columns are needed to match the script output back to rows
+            app_idx = header.index('appName') if 'appName' in header else None
+            url_idx = header.index('repoUrl') if 'repoUrl' in header else None
+            # One entry per row: None for rows the script runs, else their error result
+            entries, valid_repos, valid_rows = [], [], [header]
+            seen_apps = set()
+            for row in reader:
+                if not row:
+                    continue
+                app_name = row[app_idx] if app_idx is not None and app_idx < len(row) else 'Unknown'
+                repo_url = row[url_idx] if url_idx is not None and url_idx < len(row) else 'Unknown'
+                problems = row_problems(dict(zip(header, row)))
+                # The script also rejects a repeated appName (it names the workdir and branch)
+                if app_name in seen_apps:
+                    problems.append(f'duplicate appName {app_name!r}')
+                elif app_idx is not None and app_idx < len(row) and row[app_idx]:
+                    seen_apps.add(app_name)
+                if problems:
+                    entries.append({
+                        'repo': f"{app_name} ({repo_url})",
+                        'success': False,
+                        'error': f'Invalid row: {"; ".join(problems)}'
+                    })
+                else:
+                    entries.append(None)
+                    valid_repos.append((app_name, repo_url))
+                    valid_rows.append(row)
+        
+        invalid_count = len(entries) - len(valid_repos)
+        print(f"DEBUG: Processing {len(valid_repos)} repos from CSV ({invalid_count} invalid rows skipped)")
         
-        print(f"DEBUG: Processing {len(repos)} repos from CSV")
+        if invalid_count:
+            # Hand the script only the valid rows
+            out = io.StringIO(newline='')
+            csv.writer(out).writerows(valid_rows)
+            csv_text = out.getvalue()
         
         # Script now handles PR creation internally
-        result = run_automation_script(csv_path)
+        if valid_repos:
+            result = run_automation_script(csv_path, jobs=jobs, csv_text=csv_text)
+        else:
+            result = {'success': False, 'output': '', 'error': 'No valid rows to process'}
         
         print(f"DEBUG: Script result success={result['success']}")
         print(f"DEBUG: Script output length={len(result.get('output', ''))}")
@@ -256,25 +396,26 @@ def process_csv_data(csv_path):
         # Parse script output to extract results
         if result['success'] or result.get('output'):
             output = result.get('output', '')
-            results = parse_script_output(output, repos)
-            success_count = sum(1 for r in results if r.get('success', False))
-            print(f"DEBUG: Parsed {len(results)} results, {success_count} successful")
+            results = parse_script_output(output, valid_repos)
+            print(f"DEBUG: Parsed {len(results)} results")
         else:
             # Script failed completely
             results = []
-            for repo in repos:
-                repo_url = repo.get('repoUrl', 'Unknown')
-                app_name = repo.get('appName', 'Unknown')
+            for app_name, repo_url in valid_repos:
                 results.append({
                     'repo': f"{app_name} ({repo_url})",
                     'success': False,
                     'error': result.get('error', 'Script execution failed')
                 })
-            success_count = 0
+        
+        # Put the rejected rows back in their original positions
+        script_results = iter(results)
+        results = [entry or next(script_results) for entry in entries]
+        success_count = sum(1 for r in results if r.get('success', False))
         
         return {
             'results': results,
-            'total': len(repos),
+            'total': len(entries),
             'success': success_count,
             'success_count': success_count,  # Frontend expects this field name
             'pr_count': success_count,  # Count PRs created (same as success for now)
@@ -284,31 +425,79 @@ def process_csv_data(csv_path):
     except Exception as e:
         return {'error': str(e)}
 
+def stream_upload():
+    """Stream a multipart body to disk with streaming-form-data instead of request.files
+
+    Returns (filename, upload_path, form): filename is None when no 'file' field was
+    sent, and upload_path is a temp file in UPLOAD_FOLDER holding its content. The
+    file lands on disk during the parse, with no second copy. If the parse fails
+    (ParseFailedException, or RequestEntityTooLarge past MAX_CONTENT_LENGTH) the
+    temp file is removed before the error propagates.
+    """
+    fd, upload_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.upload')
+    os.close(fd)
+    file_target = FileTarget(upload_path)
+    parallel_target = ValueTarget()
+    try:
+        parser = StreamingFormDataParser(headers=request.headers)
+        parser.register('file', file_target)
+        parser.register('parallel', parallel_target)
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.data_received(chunk)
+    except BaseException:
+        # Close the partly written file and don't leave it in UPLOAD_FOLDER
+        file_target.on_finish()
+        os.remove(upload_path)
+        raise
+    
+    form = {'parallel': parallel_target.value.decode()} if parallel_target.value else {}
+    return getattr(file_target, 'multipart_filename', None), upload_path, form
+
 @app.route('/api/process-bulk', methods=['POST'])
 def process_bulk():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+    file, upload_path = None, None
+    if StreamingFormDataParser is not None and request.mimetype == 'multipart/form-data':
+        try:
+            original_filename, upload_path, form = stream_upload()
+        except ParseFailedException as e:
+            return jsonify({'error': f'Malformed upload: {str(e)}'}), 400
+    else:
+        file = request.files.get('file')
+        original_filename, form = (file.filename if file else None), request.form
+    
+    if upload_path and not (original_filename and allowed_file(original_filename)):
+        os.remove(upload_path)
     
-    file = request.files['file']
+    if original_filename is None:
+        return jsonify({'error': 'No file provided'}), 400
     
-    if file.filename == '':
+    if original_filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    if not allowed_file(file.filename):
+    if not allowed_file(original_filename):
         return jsonify({'error': 'Invalid file type. Please upload CSV or Excel file'}), 400
     
     try:
-        filename = secure_filename(file.filename)
+        filename = secure_filename(original_filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        if upload_path:
+            os.replace(upload_path, file_path)
+        else:
+            file.save(file_path, buffer_size=UPLOAD_CHUNK_SIZE)
         
+        csv_text = None
         if filename.endswith('.xlsx') or filename.endswith('.xls'):
-            df = pd.read_excel(file_path)
-            csv_path = file_path.rsplit('.', 1)[0] + '.csv'
-            df.to_csv(csv_path, index=False)
-            file_path = csv_path
+            # Convert in memory and pipe it to the script; no intermediate CSV file
+            buf = io.StringIO(newline='')
+            excel_to_csv(file_path, buf)
+            csv_text = buf.getvalue()
         
-        result = process_csv_data(file_path)
+        # Repos run in parallel inside the script; parallel=false processes them one at a time
+        parallel = form.get('parallel', 'true').lower() not in ('false', '0', 'no')
+        result = process_csv_data(file_path, jobs=None if parallel else 1, csv_text=csv_text)
         
         if 'error' in result:
             return jsonify({'error': result['error']}), 500
@@ -326,22 +515,22 @@ def process_form():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        required_fields = ['repoUrl', 'branch', 'appName', 'imageRepo', 'base_image', 'jar_file']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        
-        if missing_fields:
-            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        # Same check the script applies; values as they will appear in the CSV
+        problems = row_problems({key: '' if value is None else str(value) for key, value in data.items()})
         
-        csv_path = os.path.join(app.config['UPLOAD_FOLDER'], 'form_data.csv')
+        if problems:
+            return jsonify({'error': f'Invalid form data: {"; ".join(problems)}'}), 400
         
+        # Build the one-row CSV in memory and pipe it to the script: nothing is
+        # written to disk, and concurrent submissions can't overwrite each other
         fieldnames = list(data.keys())
-        with open(csv_path, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerow(data)
+        csvfile = io.StringIO(newline='')
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerow(data)
         
         # Script now handles PR creation internally
-        result = run_automation_script(csv_path)
+        result = run_automation_script('-', csv_text=csvfile.getvalue())
         
         app_name = data['appName']
         output = result.get('output', '')
@@ -377,4 +566,6 @@ def health():
     return jsonify({'status': 'healthy'}), 200
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # Local development server only; run under gunicorn in production (see DEPLOYMENT.md).
+    # The reloader/debugger is opt-in via FLASK_DEV=1.
+    app.run(debug=os.environ.get('FLASK_DEV', '').strip().lower() in ('1', 'true', 'yes'), port=5000, threaded=True)
@@ -0,0 +1,120 @@
+"""Rendering must match the string.Template-based renderer it replaced.
+
+The script used to render with an ATTemplate(string.Template) subclass and
+safe_substitute(); _PLACEHOLDER_RE and compile_template() reimplement that.
+These tests pin the two together, so a change to the regex can't silently
+change rendered output.
+"""
+import importlib.util
+import os
+import random
+import re
+import string
+import tempfile
+import unittest
+
+_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Agentic-ikp.py')
+_spec = importlib.util.spec_from_file_location('agent_apply', _SCRIPT)
+agent_apply = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(agent_apply)
+
+
+class ATTemplate(string.Template):
+    # The removed implementation, kept here as the reference.
+    delimiter = '@'
+    idpattern = r'[A-Z][_A-Z0-9]*'
+
+
+def reference_render(content, tokens):
+    content = re.sub(r'@@([A-Z][_A-Z0-9]*)@@', r'@\1', content)
+    return ATTemplate(content).safe_substitute(tokens)
+
+
+TOKENS = {
+    'APP_NAME': 'demo-app',
+    'TAG': '20240101000000',
+    'EMPTY': '',
+    'PORT': 8080,
+    'name': 'lower',
+    'Mixed_1': 'mixed',
+    'VALUE_WITH_AT': 'a@b @@X@@ @{Y}',
+}
+
+CASES = [
+    '',
+    'no placeholders at all\n',
+    'name: @APP_NAME\n',
+    'image: repo:@{TAG}-suffix',
+    'legacy @@APP_NAME@@ and @@MISSING@@ tokens',
+    'escaped @@ and @@@APP_NAME and @@@@',
+    'lowercase @name, @Mixed_1 and @{name}',
+    'unknown @UNKNOWN_TOKEN and @{UNKNOWN} stay as-is',
+    'empty value [@EMPTY] and number @PORT',
+    'stray @ at end @',
+    'email user@example.com and @ alone and @1digit and @_under',
+    'unclosed @{APP_NAME and @{} and @{1X}',
+    'adjacent @APP_NAME@TAG@APP_NAMEx@{APP_NAME}x',
+    'value containing delimiters: @VALUE_WITH_AT',
+    '@APP_NAME at start',
+    'multi\nline @APP_NAME\n  nested: "@{TAG}"\n',
+]
+
+
+class RenderEquivalenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        self._count = 0
+
+    def render(self, content, tokens):
+        # Templates are cached by path, so every case gets its own file.
+        self._count += 1
+        path = os.path.join(self._tmpdir.name, f'case{self._count}.tmpl')
+        with open(path, 'w', encoding='utf-8', newline='') as fh:
+            fh.write(content)
+        return agent_apply.compile_template(path)(tokens)
+
+    def test_cases(self):
+        for content in CASES:
+            with self.subTest(content=content):
+                self.assertEqual(self.render(content, TOKENS), reference_render(content, TOKENS))
+
+    def test_random_templates(self):
+        rng = random.Random(1234)
+        pieces = ['@', '@@', '{', '}', 'APP_NAME', 'TAG', 'name', 'X', '_', '1', 'a', ' ', '\n', '$', 'MISSING']
+        for _ in range(2000):
+            content = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 20)))
+            with self.subTest(content=content):
+                self.assertEqual(self.render(content, TOKENS), reference_render(content, TOKENS))
+
+    def test_render_cached_matches(self):
+        # APP_NAME is a per-row token, so this takes the direct-render path.
+        content = 'port: @PORT name: @APP_NAME tag: @{TAG} @@MISSING@@'
+        self.render(content, TOKENS)
+        path = os.path.join(self._tmpdir.name, f'case{self._count}.tmpl')
+        text, unresolved = agent_apply.render_cached(path, TOKENS)
+        self.assertEqual(text, reference_render(content, TOKENS))
+        self.assertFalse(unresolved)
+
+    def test_render_cached_reuses_shared_outputs(self):
+        # Only shared tokens, so render_cached() goes through the LRU.
+        content = 'port: @PORT tag: @{TAG} @@MISSING@@ @Mixed_1'
+        self.render(content, TOKENS)
+        path = os.path.join(self._tmpdir.name, f'case{self._count}.tmpl')
+        other = {**TOKENS, 'TAG': '20250101000000'}
+        agent_apply._render_shared.cache_clear()
+
+        first = agent_apply.render_cached(path, TOKENS)
+        second = agent_apply.render_cached(path, dict(TOKENS))
+        third = agent_apply.render_cached(path, other)
+
+        self.assertEqual(first, (reference_render(content, TOKENS), False))
+        self.assertEqual(second, first)
+        self.assertEqual(third, (reference_render(content, other), False))
+        info = agent_apply._render_shared.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
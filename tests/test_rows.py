@@ -0,0 +1,90 @@
+"""CSV row validation in load_rows() and row_problems()."""
+import importlib.util
+import os
+import tempfile
+import unittest
+
+_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Agentic-ikp.py')
+_spec = importlib.util.spec_from_file_location('agent_apply', _SCRIPT)
+agent_apply = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(agent_apply)
+
+ROW = {
+    'repoUrl': 'https://github.example/org/repo.git',
+    'branch': 'main',
+    'imageRepo': 'reg.example/com/app',
+    'appName': 'app1',
+    'base_image': 'base:1',
+    'jar_file': 'app.jar',
+    'cm_env_config_name': 'cm',
+    'mongo_db_creds_secret_name': 'sec',
+    'cm_db_config_name': 'db',
+    'ingress_hosts': 'a.example',
+    'service_port': '8080',
+    'service_target_port': '8081',
+}
+
+
+class RowProblemsTest(unittest.TestCase):
+
+    def test_valid_row(self):
+        self.assertEqual(agent_apply.row_problems(ROW), [])
+
+    def test_missing_required_column_with_token_default(self):
+        # service_port/service_target_port have token defaults, but the CSV must
+        # still provide them.
+        row = {k: v for k, v in ROW.items() if k not in ('service_port', 'service_target_port')}
+        self.assertEqual(agent_apply.row_problems(row),
+                         ["missing required CSV columns ['service_port', 'service_target_port']"])
+
+    def test_empty_required_column(self):
+        self.assertEqual(agent_apply.row_problems({**ROW, 'jar_file': ''}),
+                         ["missing required CSV columns ['jar_file']"])
+
+    def test_required_tokens(self):
+        # Absent: the default applies. Present but blank: rejected.
+        self.assertEqual(agent_apply.row_problems(ROW), [])
+        self.assertEqual(agent_apply.row_problems({**ROW, 'nexus_jenkins_cred': ''}),
+                         ["missing required tokens ['NEXUS_JENKINS_CRED']"])
+
+
+class LoadRowsTest(unittest.TestCase):
+
+    def load(self, text):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='') as fh:
+            fh.write(text)
+        self.addCleanup(os.unlink, fh.name)
+        return agent_apply.load_rows(fh.name)
+
+    def test_fills_defaults(self):
+        rows = self.load(','.join(ROW) + '\n' + ','.join(ROW.values()) + '\n')
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['service_port'], '8080')
+        self.assertEqual(rows[0]['nexus_jenkins_cred'], 'GB-SVC-CDMS-SHP')
+        self.assertIs(rows[0]['skipLocalBuild'], False)
+
+    def test_missing_columns_stop_the_run(self):
+        columns = [k for k in ROW if k not in ('service_port', 'service_target_port')]
+        text = ','.join(columns) + '\n' + ','.join(ROW[k] for k in columns) + '\n'
+        with self.assertRaises(SystemExit) as cm:
+            self.load(text)
+        self.assertIn("line 2 (https://github.example/org/repo.git): missing required CSV columns "
+                      "['service_port', 'service_target_port']", str(cm.exception))
+
+    def test_short_row(self):
+        # Values past the end of a short row count as absent.
+        values = list(ROW.values())[:-1]
+        with self.assertRaises(SystemExit) as cm:
+            self.load(','.join(ROW) + '\n' + ','.join(values) + '\n')
+        self.assertIn("missing required CSV columns ['service_target_port']", str(cm.exception))
+
+    def test_duplicate_app_name(self):
+        line = ','.join(ROW.values())
+        with self.assertRaises(SystemExit) as cm:
+            self.load(','.join(ROW) + '\n' + line + '\n' + line + '\n')
+        self.assertIn("line 3 (https://github.example/org/repo.git): duplicate appName 'app1' (first on line 2)",
+                      str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()